@@ -0,0 +1,107 @@
+"""
+Measures the cost of serializing /generate responses.
+
+Compares what FastAPI itself does for a response_model route (validate the returned model,
+then dump it to JSON bytes through pydantic), the in-memory path used by main.py
+(model_construct and the same pydantic serializer, no validation), an orjson variant of it and the spooled path used for
+large responses (temporary file, streamed out in chunks).
+Peak memory is what tracemalloc sees on top of the already generated base64 strings.
+
+Usage: python -m benchmarks.serialization
+"""
+import asyncio
+import base64
+import os
+import time
+import tracemalloc
+from typing import Callable, List
+
+import orjson
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+
+from models.schemas import GeneratedImage, GenerationResponse
+from services.memory import ImageSpool
+
+# Approximate base64 payload of one PNG per image size
+IMAGE_BYTES = {"SMALL": 400_000, "MEDIUM": 900_000, "LARGE": 1_600_000}
+BATCH_SIZES = [1, 4, 16]
+ROUNDS = 5
+
+RESPONSE_FIELD = create_model_field(name="Response", type_=GenerationResponse, mode="serialization")
+LOOP = asyncio.new_event_loop()
+RESPONSE_ADAPTER = TypeAdapter(GenerationResponse)
+
+
+def make_images(num_images: int, image_bytes: int) -> List[str]:
+    return [base64.b64encode(os.urandom(image_bytes)).decode("utf-8") for _ in range(num_images)]
+
+
+def response_model_path(base64_images: List[str]) -> bytes:
+    response = GenerationResponse(
+        images=[GeneratedImage(engine_name="bench", base64_image=image) for image in base64_images]
+    )
+    # The same call FastAPI makes for a response_model route with the default response class
+    return LOOP.run_until_complete(serialize_response(field=RESPONSE_FIELD, response_content=response, dump_json=True))
+
+
+def construct_response(base64_images: List[str]) -> GenerationResponse:
+    return GenerationResponse.model_construct(
+        images=[GeneratedImage.model_construct(engine_name="bench", base64_image=image) for image in base64_images],
+        failed_engines=[],
+        timing=None
+    )
+
+
+def fast_path(base64_images: List[str]) -> bytes:
+    return RESPONSE_ADAPTER.dump_json(construct_response(base64_images))
+
+
+def orjson_path(base64_images: List[str]) -> bytes:
+    # Rejected for main.py: less CPU, but the output buffer growth doubles peak memory
+    return orjson.dumps(construct_response(base64_images).model_dump())
+
+
+def spooled_path(base64_images: List[str]) -> int:
+    spool = ImageSpool()
+    spool.extend(GeneratedImage.model_construct(engine_name="bench", base64_image=image) for image in base64_images)
+    # Stand in for the socket: consume the body chunk by chunk without keeping it
+    size = 0
+    for chunk in spool.iter_json():
+        size += len(chunk)
+    return size
+
+
+def measure(path: Callable[[List[str]], object], base64_images: List[str]):
+    """Returns (best wall time in ms, peak traced memory in MB) over ROUNDS runs"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        path(base64_images)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    path(base64_images)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1_000_000
+
+
+def main():
+    print(f"{'size':<8}{'images':>8}{'path':>16}{'time ms':>12}{'peak MB':>12}")
+    for size, image_bytes in IMAGE_BYTES.items():
+        for num_images in BATCH_SIZES:
+            base64_images = make_images(num_images, image_bytes)
+            for name, path in (
+                    ("response_model", response_model_path),
+                    ("fast", fast_path),
+                    ("orjson", orjson_path),
+                    ("spooled", spooled_path),
+            ):
+                elapsed, peak = measure(path, base64_images)
+                print(f"{size:<8}{num_images:>8}{name:>16}{elapsed:>12.2f}{peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
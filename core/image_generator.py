@@ -1,11 +1,20 @@
+import asyncio
+import contextvars
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import List, Dict, Any, Type
+from typing import List, Dict, Any, Type, Callable, TypeVar
 
 from models.schemas import EngineRequirement
 
+T = TypeVar("T")
+
 
 class ImageGenerator(ABC):
+    # Number of generate calls the hub lets run on this engine at the same time
+    max_concurrency: int = 4
+    # Whether the engine honours params["seed"], so a quick low-resolution preview matches the full render
+    supports_preview: bool = False
+
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
@@ -39,6 +48,26 @@ class ImageGenerator(ABC):
                 f"Invalid size value: {size_value}. Expected one of: small, medium, large"
             ) from e
 
+    async def run_blocking(self, func: Callable[[], T]) -> T:
+        """
+        Runs blocking work such as a local pipeline in the default executor.
+        An executor thread cannot be interrupted, so if the caller is cancelled this still waits for func
+        to finish before re-raising. That keeps the engine's scheduler slot held for as long as the work runs.
+        """
+        loop = asyncio.get_running_loop()
+        # Executor threads do not inherit the request context, so carry the current span over explicitly
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(None, context.run, func)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            while not future.done():
+                try:
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    pass
+            raise
+
     @abstractmethod
     async def generate(self, params: Dict[str, Any], prompt: str, size: Enum, num_images: int) -> List[str]:
         """Generate images and return them as base64 strings"""
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Iterator
+
+SERVICE_NAME = "ImageGeneratorHub"
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed unit of work inside a request. Spans form a tree rooted at the request span.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes: Dict[str, Any] = attributes or {}
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+    def start_child(self, name: str, **attributes) -> "Span":
+        """Opens a child span explicitly, for work that runs outside the context the trace was started in"""
+        child = Span(name, trace_id=self.trace_id, parent=self, attributes=attributes)
+        self.children.append(child)
+        return child
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the span tree as plain data, suitable for a debug response field"""
+        data = {
+            "name": self.name,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Span]:
+    """Opens the root span of a new trace and makes it current"""
+    root = Span(name, trace_id=secrets.token_hex(16), attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = str(e)
+        raise
+    finally:
+        root.end()
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Records a child of the current span. Outside of a trace this does nothing,
+    so engines and utils can be called without a request around them.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, trace_id=parent.trace_id, parent=parent, attributes=attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = str(e)
+        raise
+    finally:
+        child.end()
+        _current_span.reset(token)
+
+
+def server_timing_header(root: Span) -> str:
+    """
+    Formats a span tree as a Server-Timing header value.
+    Spans sharing a name are summed, e.g. every URL download of a request is one 'download' metric.
+    """
+    totals: Dict[str, float] = {}
+    for item in root.walk():
+        metric = re.sub(r"[^A-Za-z0-9_.\-]", "_", item.name)
+        totals[metric] = totals.get(metric, 0.0) + item.duration_ms
+    return ", ".join(f"{metric};dur={duration:.1f}" for metric, duration in totals.items())
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(root: Span) -> Dict[str, Any]:
+    """Converts a span tree to the OpenTelemetry OTLP/JSON trace format"""
+    spans = []
+    for item in root.walk():
+        otlp_span = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns if item.end_ns is not None else time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+        }
+        if item.parent is not None:
+            otlp_span["parentSpanId"] = item.parent.span_id
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]
+                },
+                "scopeSpans": [{"scope": {"name": "imagegeneratorhub"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def export_trace(root: Span, path: Optional[str] = None):
+    """
+    Appends the trace as one OTLP/JSON line to a local file, which an OpenTelemetry
+    collector can pick up with its file receiver. Uses TRACE_EXPORT_PATH when no path is given
+    and does nothing if neither is set.
+    """
+    path = path or TRACE_EXPORT_PATH
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(to_otlp_json(root)) + "\n")
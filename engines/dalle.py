@@ -5,6 +5,7 @@ from fastapi import HTTPException
 from openai import AsyncOpenAI
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import EngineRequirement
 
 
@@ -27,12 +28,13 @@ class DallEGenerator(ImageGenerator):
 
         # try:
         client = AsyncOpenAI(api_key=params["api_key"])
-        response = await client.images.generate(
-            prompt=prompt,
-            size=f"{size.value[0]}x{size.value[1]}",
-            n=num_images,
-            response_format="b64_json"
-        )
+        with span("api_call"):
+            response = await client.images.generate(
+                prompt=prompt,
+                size=f"{size.value[0]}x{size.value[1]}",
+                n=num_images,
+                response_format="b64_json"
+            )
         return [img.b64_json for img in response.data]
 
         # except Exception as e:
@@ -6,6 +6,7 @@ import aiohttp
 from fastapi import HTTPException
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import EngineRequirement
 
 
@@ -45,25 +46,26 @@ class LocalGenerator(ImageGenerator):
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=request_data) as response:
-                    if response.status != 200:
-                        error_detail = await response.text()
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Local service error: {error_detail}"
-                        )
-
-                    data = await response.json()
-
-                    # Assuming the response is a list of base64 encoded images
-                    if not isinstance(data, list) or len(data) != num_images:
-                        raise HTTPException(
-                            status_code=500,
-                            detail="Invalid response format from local service"
-                        )
-
-                    return data
+            with span("api_call"):
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(url, json=request_data) as response:
+                        if response.status != 200:
+                            error_detail = await response.text()
+                            raise HTTPException(
+                                status_code=response.status,
+                                detail=f"Local service error: {error_detail}"
+                            )
+
+                        data = await response.json()
+
+                        # Assuming the response is a list of base64 encoded images
+                        if not isinstance(data, list) or len(data) != num_images:
+                            raise HTTPException(
+                                status_code=500,
+                                detail="Invalid response format from local service"
+                            )
+
+                        return data
 
         except aiohttp.ClientError as e:
             raise HTTPException(
@@ -5,6 +5,7 @@ import replicate
 from fastapi import HTTPException
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import EngineRequirement
 from utils import url_to_base64, img_to_base64
 
@@ -39,10 +40,11 @@ class ReplicateGenerator(ImageGenerator):
             "output_format": "png"
         }
 
-        response = await client.async_run(
-            model,
-            input=input_params
-        )
+        with span("api_call", model=model):
+            response = await client.async_run(
+                model,
+                input=input_params
+            )
         return [url_to_base64(url) for url in response]
 
         # except Exception as e:
@@ -96,10 +98,11 @@ class RealVisXL(ImageGenerator):
             "num_inference_steps": 25
         }
 
-        response = await client.async_run(
-            model,
-            input=input_params
-        )
+        with span("api_call", model=model):
+            response = await client.async_run(
+                model,
+                input=input_params
+            )
         return [url_to_base64(url) for url in response]
 
     def get_required_params(self) -> List[EngineRequirement]:
@@ -138,10 +141,11 @@ class Imagen3(ImageGenerator):
         }
         results = []
         for i in range(num_images):
-            response = await client.async_run(
-                model,
-                input=input_params
-            )
+            with span("api_call", model=model):
+                response = await client.async_run(
+                    model,
+                    input=input_params
+                )
             results.append(url_to_base64(response))
 
         return results
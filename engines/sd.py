@@ -1,5 +1,4 @@
 # file: stable_diffusion_xl.py
-import asyncio
 import base64
 import io
 from enum import Enum
@@ -11,9 +10,14 @@ from huggingface_hub import hf_hub_download
 from safetensors.torch import load_file
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import EngineRequirement
 
 class StableDiffusionXLGenerator(ImageGenerator):
+    # The local pipeline serves one batch at a time
+    max_concurrency = 1
+    supports_preview = True
+
     class Size(Enum):
         SMALL = (512, 512)
         MEDIUM = (768, 768)
@@ -58,27 +62,35 @@ class StableDiffusionXLGenerator(ImageGenerator):
         )
 
     async def generate(self, params: Dict[str, Any], prompt: str, size: "StableDiffusionXLGenerator.Size", num_images: int) -> List[str]:
-        loop = asyncio.get_running_loop()
         width, height = size.value
+        seed = params.get("seed")
 
         def run_pipeline() -> List[str]:
             images = []
-            results = self.pipeline(
-                prompt,
-                height=height,
-                width=width,
-                num_inference_steps=2,
-                guidance_scale=0,
-                num_images_per_prompt=num_images,
-            )
+            # One generator per image so each image is reproducible on its own, whatever the batch size
+            generator = None
+            if seed is not None:
+                generator = [torch.Generator("cpu").manual_seed(int(seed) + i) for i in range(num_images)]
+            with span("inference", width=width, height=height, num_images=num_images):
+                results = self.pipeline(
+                    prompt,
+                    height=height,
+                    width=width,
+                    num_inference_steps=2,
+                    guidance_scale=0,
+                    num_images_per_prompt=num_images,
+                    generator=generator,
+                )
             for img in results.images:
                 buffered = io.BytesIO()
-                img.save(buffered, format="PNG")
-                base64_img = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                with span("png_encode"):
+                    img.save(buffered, format="PNG")
+                with span("base64"):
+                    base64_img = base64.b64encode(buffered.getvalue()).decode("utf-8")
                 images.append(base64_img)
             return images
 
-        return await loop.run_in_executor(None, run_pipeline)
+        return await self.run_blocking(run_pipeline)
 
     def get_required_params(self) -> List[EngineRequirement]:
         return []
\ No newline at end of file
@@ -1,11 +1,11 @@
 
-import asyncio
 import base64
 import io
 from enum import Enum
 from typing import List, Dict, Any
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import EngineRequirement
 
 
@@ -22,6 +22,10 @@ def get_sd_turbo_model():
 
 
 class SDTurboGenerator(ImageGenerator):
+    # The local pipeline serves one batch at a time
+    max_concurrency = 1
+    supports_preview = True
+
     class Size(Enum):
         SMALL = (512, 512)
         MEDIUM = (768, 768)
@@ -36,27 +40,37 @@ class SDTurboGenerator(ImageGenerator):
 
     async def generate(self, params: Dict[str, Any], prompt: str, size: "SDTurboGenerator.Size",
                        num_images: int) -> List[str]:
-        loop = asyncio.get_running_loop()
         width, height = size.value
+        seed = params.get("seed")
 
         def run_pipeline() -> List[str]:
+            import torch
+
             images = []
-            results = self.pipe(
-                prompt,
-                height=height,
-                width=width,
-                num_inference_steps=1,
-                guidance_scale=0.0,
-                num_images_per_prompt=num_images,
-            )
+            # One generator per image so each image is reproducible on its own, whatever the batch size
+            generator = None
+            if seed is not None:
+                generator = [torch.Generator("cpu").manual_seed(int(seed) + i) for i in range(num_images)]
+            with span("inference", width=width, height=height, num_images=num_images):
+                results = self.pipe(
+                    prompt,
+                    height=height,
+                    width=width,
+                    num_inference_steps=1,
+                    guidance_scale=0.0,
+                    num_images_per_prompt=num_images,
+                    generator=generator,
+                )
             for img in results.images:
                 buffered = io.BytesIO()
-                img.save(buffered, format="PNG")
-                base64_img = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                with span("png_encode"):
+                    img.save(buffered, format="PNG")
+                with span("base64"):
+                    base64_img = base64.b64encode(buffered.getvalue()).decode("utf-8")
                 images.append(base64_img)
             return images
 
-        return await loop.run_in_executor(None, run_pipeline)
+        return await self.run_blocking(run_pipeline)
 
     def get_required_params(self) -> List[EngineRequirement]:
         return []
@@ -1,16 +1,27 @@
+import asyncio
+import weakref
+
+import orjson
 from engines.sd_turbo import SDTurboGenerator
 from fastapi import FastAPI
-from typing import List
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from starlette.background import BackgroundTask
+from typing import List, Dict, Any, Optional, Iterator
 
+from core.tracing import TRACE_EXPORT_PATH, Span, start_trace, span, server_timing_header, export_trace
 from engines.dalle import DallEGenerator
 from engines.local import LocalGenerator
 from engines.sd import StableDiffusionXLGenerator
 from engines.replicate import ReplicateGenerator, RealVisXL, Imagen3
 from models.schemas import GenerationRequest, GenerationResponse, EngineInfo
 from services.hub import ImageGeneratorHub
+from services.memory import ImageSpool, Reservation, in_flight_bytes, should_spool, stream_in_flight_bytes
 
 app = FastAPI(title="ImageGeneratorHub")
 hub = ImageGeneratorHub()
+# The serializer FastAPI itself uses for response_model, writes JSON bytes directly from the model
+response_adapter = TypeAdapter(GenerationResponse)
 
 
 @app.on_event("startup")
@@ -30,7 +41,95 @@ async def list_engines():
     return hub.get_available_engines()
 
 
+def _hold_until_sent(response: Response, reservation: Reservation) -> Response:
+    """
+    Keeps the memory reservation of a request until its response has been sent.
+    Starlette skips background tasks when the client disconnects mid-body, so the reservation is also
+    released when the response, and with it the body, is freed.
+    """
+    response.background = BackgroundTask(reservation.release)
+    weakref.finalize(response, reservation.release)
+    return response
+
+
+def _spooled_body(spool: ImageSpool, timing: Optional[Dict[str, Any]], trace: Span) -> Iterator[bytes]:
+    """
+    Streams a spooled response body, timing it as the trace's serialize span.
+    The body is sent after the headers, so this span only shows up in the exported trace, not in Server-Timing.
+    """
+    serialize = trace.start_child("serialize", spooled=True)
+    try:
+        yield from spool.iter_json(timing)
+    except Exception as e:
+        serialize.error = str(e)
+        raise
+    finally:
+        serialize.end()
+        if TRACE_EXPORT_PATH:
+            export_trace(trace)
+
+
 @app.post("/generate", response_model=GenerationResponse)
 async def generate_images(request: GenerationRequest):
-    """Generate images using specified engines with provided credentials"""
-    return await hub.generate_images(request)
+    """
+    Generate images using specified engines with provided credentials.
+    The response is built from already trusted data, so it is encoded with the response_model serializer
+    and returned directly, skipping FastAPI's re-validation. response_model is kept for the OpenAPI schema.
+    orjson would save some CPU here but its buffer growth doubles peak memory for large bodies
+    (see benchmarks/serialization.py), which matters more for responses made of base64 images.
+    Large responses are spooled to a temporary file while generating and streamed out from there.
+    Requests are refused with 503 while the worker's image memory budget is exhausted,
+    and with 413 if they could never fit in it.
+    """
+    trace = None
+    spool = None
+    hub.validate_request(request)
+    reservation = hub.memory.acquire(in_flight_bytes(request))
+    try:
+        with start_trace("generate") as trace:
+            if should_spool(request):
+                spool = await hub.generate_images_to_spool(request)
+                timing = trace.to_dict() if request.include_timing else None
+            else:
+                response = await hub.generate_images(request)
+
+                with span("serialize"):
+                    if request.include_timing:
+                        response.timing = trace.to_dict()
+                    body = response_adapter.dump_json(response)
+    except BaseException:
+        reservation.release()
+        raise
+    finally:
+        # Spooled responses export their trace once the body has been streamed
+        if TRACE_EXPORT_PATH and trace is not None and spool is None:
+            asyncio.get_running_loop().run_in_executor(None, export_trace, trace)
+
+    headers = {"Server-Timing": server_timing_header(trace)}
+    if spool is not None:
+        return _hold_until_sent(
+            StreamingResponse(_spooled_body(spool, timing, trace), media_type="application/json", headers=headers),
+            reservation
+        )
+    return _hold_until_sent(Response(content=body, media_type="application/json", headers=headers), reservation)
+
+
+@app.post("/generate/stream")
+async def stream_images(request: GenerationRequest):
+    """
+    Generate images and stream them as newline delimited JSON StreamEvents as soon as each engine finishes.
+    Set preview to get a quick SMALL render from local engines before the full size image.
+    Disconnecting drops renders still waiting for an engine, renders already running finish and are discarded.
+    Errors after the stream has started are sent as a final ERROR event.
+    Requests are refused with 503 while the worker's image memory budget is exhausted,
+    and with 413 if they could never fit in it.
+    """
+    # Validate before the response starts, so a bad request still gets a plain HTTP error
+    stream = hub.stream_images(request)
+    reservation = hub.memory.acquire(stream_in_flight_bytes(request))
+
+    async def events():
+        async for event in stream:
+            yield orjson.dumps(event.model_dump(exclude_none=True)) + b"\n"
+
+    return _hold_until_sent(StreamingResponse(events(), media_type="application/x-ndjson"), reservation)
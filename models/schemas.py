@@ -1,6 +1,6 @@
 # app/models/schemas.py
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from typing import List
 
 from pydantic import BaseModel, Field
@@ -12,6 +12,16 @@ class ImageSize(str, Enum):
     LARGE = "LARGE"
 
 
+class Priority(str, Enum):
+    INTERACTIVE = "INTERACTIVE"
+    BULK = "BULK"
+
+
+class DistributionMode(str, Enum):
+    EVEN = "EVEN"
+    WEIGHTED = "WEIGHTED"
+
+
 class EngineRequirement(BaseModel):
     name: str
     description: str
@@ -31,12 +41,28 @@ class EngineConfig(BaseModel):
 
 class GenerationRequest(BaseModel):
     engines: List[EngineConfig]
-    num_engines_to_use: int = Field(..., description="Number of engines to use")
-    num_images: int = Field(1, description="Number of images to generate per engine")
+    num_engines_to_use: int = Field(..., ge=1, description="Number of engines to use")
+    num_images: int = Field(1, ge=1, description="Number of images to generate per engine")
     image_size: ImageSize = Field(
         ImageSize.MEDIUM, description="Image size. Acceptable values: SMALL, MEDIUM, LARGE"
     )
     use_fallback: bool = Field(False, description="Whether to use fallback engines on failure")
+    distribution: DistributionMode = Field(
+        DistributionMode.EVEN,
+        description="How images are split across engines. EVEN gives each engine num_images, "
+                    "WEIGHTED splits the total by measured engine throughput and queue depth"
+    )
+    priority: Priority = Field(
+        Priority.INTERACTIVE,
+        description="Scheduling class. BULK work gets a smaller share of engine capacity and is shed first under overload"
+    )
+    tenant: Optional[str] = Field(None, description="Tenant the request is scheduled for, requests of one tenant share a queue")
+    seed: Optional[int] = Field(None, description="Random seed passed to engines that support seeding")
+    preview: bool = Field(
+        False,
+        description="Streaming only. Engines that support it first send a SMALL preview rendered with the same seed"
+    )
+    include_timing: bool = Field(False, description="Whether to include the request's timing breakdown in the response")
 
 
 class GeneratedImage(BaseModel):
@@ -44,6 +70,25 @@ class GeneratedImage(BaseModel):
     base64_image: str
 
 
+class StreamEventType(str, Enum):
+    PREVIEW = "PREVIEW"
+    IMAGE = "IMAGE"
+    DONE = "DONE"
+    ERROR = "ERROR"
+
+
+class StreamEvent(BaseModel):
+    type: StreamEventType
+    engine_name: Optional[str] = None
+    index: Optional[int] = Field(None, description="Position of the image in its engine's batch, pairs a PREVIEW with its IMAGE")
+    base64_image: Optional[str] = None
+    seed: Optional[int] = Field(None, description="Seed that reproduces this image, for engines that support seeding")
+    failed_engines: List[str] = Field(default_factory=list)
+    status_code: Optional[int] = Field(None, description="HTTP status of the error that ended the stream")
+    detail: Optional[str] = None
+
+
 class GenerationResponse(BaseModel):
     images: List[GeneratedImage] = Field(default_factory=list)
     failed_engines: List[str] = Field(default_factory=list)
+    timing: Optional[Dict[str, Any]] = Field(None, description="Span tree of the request, if include_timing was set")
@@ -1,22 +1,41 @@
-from typing import List, Dict, Tuple
+import asyncio
+import random
+import time
+from typing import List, Dict, Tuple, Optional, AsyncIterator
 
 from fastapi import HTTPException
 
 from core.image_generator import ImageGenerator
+from core.tracing import span
 from models.schemas import (
+    DistributionMode,
     EngineInfo,
     GenerationRequest,
     GenerationResponse,
-    GeneratedImage
+    GeneratedImage,
+    ImageSize,
+    Priority,
+    StreamEvent,
+    StreamEventType
 )
+from services.memory import MEMORY_BUDGET_BYTES, ImageSpool, MemoryBudget
+from services.scheduler import FairScheduler
+from services.throughput import EngineThroughput, allocate_images
 
 
 class ImageGeneratorHub:
     def __init__(self):
         self.engines: Dict[str, ImageGenerator] = {}
+        # Kept per size, a SMALL render says little about how fast the same engine renders LARGE
+        self.throughput: Dict[Tuple[str, ImageSize], EngineThroughput] = {}
+        self.schedulers: Dict[str, FairScheduler] = {}
+        self.memory = MemoryBudget(MEMORY_BUDGET_BYTES)
 
     def register_engine(self, engine: ImageGenerator):
         self.engines[engine.name] = engine
+        for size in ImageSize:
+            self.throughput[(engine.name, size)] = EngineThroughput()
+        self.schedulers[engine.name] = FairScheduler(max_concurrency=engine.max_concurrency)
 
     def get_available_engines(self) -> List[EngineInfo]:
         return [
@@ -33,29 +52,174 @@ class ImageGeneratorHub:
             engine: ImageGenerator,
             config: dict,
             size: str,
-            num_images: int
+            num_images: int,
+            priority: Priority,
+            tenant: Optional[str]
     ) -> Tuple[bool, List[GeneratedImage]]:
         """
-        Attempts to generate images with a single engine.
-        Returns (success, images) tuple.
+        Attempts to generate images with a single engine, waiting for a slot on its scheduler first.
+        Returns (success, images) tuple. Raises Overloaded if the call is shed while queued.
         """
+        scheduler = self.schedulers[engine.name]
+        stats = self.throughput[(engine.name, ImageSize(size))]
+        stats.start(num_images)
+        started = time.perf_counter()
+        success = False
         try:
-            base64_images = await engine.generate(
-                params=config["params"],
-                prompt=config["prompt"],
-                size=engine.convert_size(size),
-                num_images=num_images
-            )
+            with span("queue", engine=engine.name, priority=priority.value):
+                await scheduler.acquire(priority, tenant, num_images)
+            started = time.perf_counter()
 
-            return True, [
-                GeneratedImage(
-                    engine_name=engine.name,
-                    base64_image=base64_image
-                )
-                for base64_image in base64_images
+            try:
+                with span(f"engine.{engine.name}", num_images=num_images):
+                    base64_images = await engine.generate(
+                        params=config["params"],
+                        prompt=config["prompt"],
+                        size=engine.convert_size(size),
+                        num_images=num_images
+                    )
+                success = True
+
+                # Engines always return base64 strings, so skip per-image validation
+                return True, [
+                    GeneratedImage.model_construct(
+                        engine_name=engine.name,
+                        base64_image=base64_image
+                    )
+                    for base64_image in base64_images
+                ]
+            except Exception as e:
+                return False, []
+            finally:
+                scheduler.release()
+        finally:
+            stats.finish(num_images, time.perf_counter() - started, success)
+
+    def _rates(self, engines: List[ImageGenerator], size: ImageSize) -> List[float]:
+        """
+        Returns the estimated images per second of each engine at the given size.
+        Engines without measurements, and stale measurements over time, count as the average measured engine.
+        """
+        measured = [
+            self.throughput[(engine.name, size)].images_per_second
+            for engine in engines
+            if self.throughput[(engine.name, size)].images_per_second
+        ]
+        default_rate = sum(measured) / len(measured) if measured else 1.0
+        return [self.throughput[(engine.name, size)].estimated_rate(default_rate) for engine in engines]
+
+    def _allocate_by_throughput(self, engines: List[ImageGenerator], size: str, total_images: int) -> List[int]:
+        """
+        Splits total_images of the given size across engines in proportion to their measured throughput
+        at that size, accounting for the work each engine already has in flight at any size.
+        """
+        size = ImageSize(size)
+        rates = self._rates(engines, size)
+
+        # Express queued work of every size as the number of images of this size it would take as long as
+        queued_seconds = [0.0] * len(engines)
+        for queued_size in ImageSize:
+            queued_rates = self._rates(engines, queued_size)
+            for i, engine in enumerate(engines):
+                queued_seconds[i] += self.throughput[(engine.name, queued_size)].in_flight / queued_rates[i]
+        queue_depths = [seconds * rate for seconds, rate in zip(queued_seconds, rates)]
+
+        return allocate_images(total_images, rates, queue_depths)
+
+    @staticmethod
+    async def _store_images(collected, images: List[GeneratedImage]):
+        """Adds a batch to the collected images, writing it out of the event loop when they are spooled to disk"""
+        if isinstance(collected, ImageSpool):
+            await collected.extend_async(images)
+        else:
+            collected.extend(images)
+
+    async def _generate_weighted(
+            self,
+            engine_configs: List[dict],
+            size: str,
+            total_images: int,
+            num_engines_to_use: int,
+            use_fallback: bool,
+            priority: Priority,
+            tenant: Optional[str],
+            sink: Optional[ImageSpool] = None
+    ) -> Tuple[List[GeneratedImage], List[str]]:
+        """
+        Generates images by splitting total_images across engines by throughput and running them concurrently.
+        On failure the remaining images are spread across all engines that have not failed yet.
+        Images are collected into sink when given, otherwise into a list.
+        Returns (generated_images, failed_engines).
+        """
+        successful_images = sink if sink is not None else []
+        failed_engines = []
+        remaining_images = total_images
+        requested: Dict[str, int] = {}
+        candidates = engine_configs[:num_engines_to_use]
+
+        while remaining_images > 0 and candidates:
+            runnable = []
+            for config in candidates:
+                engine = self.engines.get(config["name"])
+                if not engine:
+                    failed_engines.append(config["name"])
+                    if not use_fallback:
+                        raise HTTPException(status_code=400, detail=f"Engine {config['name']} not found")
+                    continue
+                runnable.append((engine, config))
+
+            if not runnable:
+                break
+
+            allocation = self._allocate_by_throughput([engine for engine, _ in runnable], size, remaining_images)
+            attempts = [
+                (engine, config, num_images)
+                for (engine, config), num_images in zip(runnable, allocation)
+                if num_images > 0
+            ]
+            tasks = [
+                asyncio.create_task(self._try_generate_with_engine(
+                    engine=engine,
+                    config=self._seeded_batch(config, requested, num_images),
+                    size=size,
+                    num_images=num_images,
+                    priority=priority,
+                    tenant=tenant
+                ))
+                for engine, config, num_images in attempts
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # e.g. one call was shed, the others would hold engine slots for a request that is gone
+                for task in tasks:
+                    task.cancel()
+                raise
+
+            generated = 0
+            for (engine, config, _), (success, images) in zip(attempts, results):
+                if success:
+                    await self._store_images(successful_images, images)
+                    generated += len(images)
+                else:
+                    failed_engines.append(config["name"])
+                    if not use_fallback:
+                        raise HTTPException(
+                            status_code=500,
+                            detail=f"Engine {config['name']} failed to generate images"
+                        )
+            remaining_images -= generated
+
+            if not use_fallback or (generated == 0 and all(success for success, _ in results)):
+                break
+
+            # Spread what is left over every engine that has not failed yet
+            candidates = [
+                config for config in engine_configs
+                if config["name"] not in failed_engines
             ]
-        except Exception as e:
-            return False, []
+
+        return successful_images, failed_engines
 
     async def _generate_with_redistribution(
             self,
@@ -64,15 +228,20 @@ class ImageGeneratorHub:
             total_images: int,
             images_per_engine: int,
             num_engines_to_use: int,
-            use_fallback: bool
+            use_fallback: bool,
+            priority: Priority,
+            tenant: Optional[str],
+            sink: Optional[ImageSpool] = None
     ) -> Tuple[List[GeneratedImage], List[str]]:
         """
         Generates images with fallback and load redistribution.
+        Images are collected into sink when given, otherwise into a list.
         Returns (generated_images, failed_engines).
         """
-        successful_images = []
+        successful_images = sink if sink is not None else []
         failed_engines = []
         remaining_images = total_images
+        requested: Dict[str, int] = {}
 
         # First attempt: Try with requested number of engines
         for config in engine_configs[:num_engines_to_use]:
@@ -88,13 +257,15 @@ class ImageGeneratorHub:
 
             success, images = await self._try_generate_with_engine(
                 engine=engine,
-                config=config,
+                config=self._seeded_batch(config, requested, images_per_engine),
                 size=size,
-                num_images=images_per_engine
+                num_images=images_per_engine,
+                priority=priority,
+                tenant=tenant
             )
 
             if success:
-                successful_images.extend(images)
+                await self._store_images(successful_images, images)
                 remaining_images -= images_per_engine
             else:
                 failed_engines.append(config["name"])
@@ -124,13 +295,15 @@ class ImageGeneratorHub:
 
                 success, images = await self._try_generate_with_engine(
                     engine=engine,
-                    config=config,
+                    config=self._seeded_batch(config, requested, remaining_images),
                     size=size,
-                    num_images=remaining_images  # Try to generate all remaining images
+                    num_images=remaining_images,  # Try to generate all remaining images
+                    priority=priority,
+                    tenant=tenant
                 )
 
                 if success:
-                    successful_images.extend(images)
+                    await self._store_images(successful_images, images)
                     remaining_images = 0
                     break
                 else:
@@ -138,24 +311,171 @@ class ImageGeneratorHub:
 
         return successful_images, failed_engines
 
-    async def generate_images(self, request: GenerationRequest) -> GenerationResponse:
+    def validate_request(self, request: GenerationRequest):
+        """Raises HTTPException 400 for requests that cannot be served, before any memory or engine slot is held for them"""
         if request.num_engines_to_use > len(request.engines):
             raise HTTPException(
                 status_code=400,
                 detail="num_engines_to_use cannot be greater than number of provided engines"
             )
 
+    def _engine_configs(self, request: GenerationRequest, seed: Optional[int]) -> List[dict]:
+        """
+        Dumps the engine configs of a request, adding the request seed to engines that did not set their own.
+        Seeds are normalised to int here, raises HTTPException 400 if an engine's seed is not an integer.
+        """
+        configs = [config.model_dump() for config in request.engines]
+        for config in configs:
+            params = config["params"]
+            if params.get("seed") is None:
+                params.pop("seed", None)
+                if seed is not None:
+                    params["seed"] = seed
+                continue
+            try:
+                params["seed"] = int(params["seed"])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Seed of engine {config['name']} must be an integer")
+        return configs
+
+    @staticmethod
+    def _seeded_batch(config: dict, requested: Dict[str, int], num_images: int) -> dict:
+        """
+        Returns the config for the next batch of num_images on the config's engine, counting them in requested.
+        The seed is advanced past the images already asked of that engine in this request,
+        so an engine that is used again does not return the same images twice.
+        """
+        offset = requested.get(config["name"], 0)
+        requested[config["name"]] = offset + num_images
+        if not offset or config["params"].get("seed") is None:
+            return config
+        return {**config, "params": {**config["params"], "seed": config["params"]["seed"] + offset}}
+
+    def stream_images(self, request: GenerationRequest) -> AsyncIterator[StreamEvent]:
+        """
+        Generates images on the first num_engines_to_use engines concurrently and yields each image as it completes.
+        With request.preview, engines that support seeding first yield a SMALL render with the same seed.
+        Closing the iterator drops renders still waiting for an engine. A render already running on an engine
+        cannot be interrupted, it finishes and its images are discarded.
+        The request is validated when this is called, so the caller can turn errors into a plain HTTP error
+        by calling it before the response starts.
+        """
+        self.validate_request(request)
+        seed = request.seed if request.seed is not None else random.randrange(2 ** 32)
+        engine_configs = self._engine_configs(request, seed)[:request.num_engines_to_use]
+        return self._stream_events(request, engine_configs, seed)
+
+    async def _stream_events(
+            self,
+            request: GenerationRequest,
+            engine_configs: List[dict],
+            seed: int
+    ) -> AsyncIterator[StreamEvent]:
+        events: asyncio.Queue = asyncio.Queue()
+        failed_engines = []
+        requested: Dict[str, int] = {}
+
+        async def render(config: dict):
+            engine = self.engines.get(config["name"])
+            if not engine:
+                failed_engines.append(config["name"])
+                return
+
+            # The preview is rendered with the same seed as the full image it previews
+            config = self._seeded_batch(config, requested, request.num_images)
+            sizes = [(StreamEventType.IMAGE, request.image_size)]
+            if request.preview and engine.supports_preview and request.image_size != ImageSize.SMALL:
+                sizes.insert(0, (StreamEventType.PREVIEW, ImageSize.SMALL))
+
+            for event_type, size in sizes:
+                success, images = await self._try_generate_with_engine(
+                    engine=engine,
+                    config=config,
+                    size=size.value,
+                    num_images=request.num_images,
+                    priority=request.priority,
+                    tenant=request.tenant
+                )
+                if not success:
+                    # A failed preview is not fatal, the full render may still succeed
+                    if event_type == StreamEventType.PREVIEW:
+                        continue
+                    failed_engines.append(config["name"])
+                    return
+                # Engines that support seeding seed image i of a batch with seed + i
+                base_seed = config["params"].get("seed") if engine.supports_preview else None
+                for i, image in enumerate(images):
+                    events.put_nowait(StreamEvent.model_construct(
+                        type=event_type,
+                        engine_name=image.engine_name,
+                        index=i,
+                        base64_image=image.base64_image,
+                        seed=base_seed + i if base_seed is not None else None
+                    ))
+
+        tasks = [asyncio.create_task(render(config)) for config in engine_configs]
+        waiter = asyncio.gather(*tasks)
+        try:
+            while not waiter.done() or not events.empty():
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait([next_event, waiter], return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield next_event.result()
+                else:
+                    next_event.cancel()
+            await waiter
+        except HTTPException as e:
+            # The response has already started, so errors such as Overloaded end the stream with an event
+            yield StreamEvent.model_construct(
+                type=StreamEventType.ERROR,
+                failed_engines=failed_engines,
+                status_code=e.status_code,
+                detail=str(e.detail)
+            )
+            return
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield StreamEvent.model_construct(
+            type=StreamEventType.DONE,
+            seed=seed,
+            failed_engines=failed_engines
+        )
+
+    async def _collect_images(
+            self,
+            request: GenerationRequest,
+            sink: Optional[ImageSpool] = None
+    ) -> Tuple[List[GeneratedImage], List[str]]:
+        self.validate_request(request)
         total_images = request.num_engines_to_use * request.num_images
         images_per_engine = request.num_images
 
-        generated_images, failed_engines = await self._generate_with_redistribution(
-            engine_configs=[config.model_dump() for config in request.engines],
-            size=request.image_size.value,
-            total_images=total_images,
-            images_per_engine=images_per_engine,
-            num_engines_to_use=request.num_engines_to_use,
-            use_fallback=request.use_fallback
-        )
+        with span("hub", total_images=total_images, distribution=request.distribution.value):
+            if request.distribution == DistributionMode.WEIGHTED:
+                generated_images, failed_engines = await self._generate_weighted(
+                    engine_configs=self._engine_configs(request, request.seed),
+                    size=request.image_size.value,
+                    total_images=total_images,
+                    num_engines_to_use=request.num_engines_to_use,
+                    use_fallback=request.use_fallback,
+                    priority=request.priority,
+                    tenant=request.tenant,
+                    sink=sink
+                )
+            else:
+                generated_images, failed_engines = await self._generate_with_redistribution(
+                    engine_configs=self._engine_configs(request, request.seed),
+                    size=request.image_size.value,
+                    total_images=total_images,
+                    images_per_engine=images_per_engine,
+                    num_engines_to_use=request.num_engines_to_use,
+                    use_fallback=request.use_fallback,
+                    priority=request.priority,
+                    tenant=request.tenant,
+                    sink=sink
+                )
 
         if not generated_images:
             raise HTTPException(
@@ -170,7 +490,25 @@ class ImageGeneratorHub:
                     detail="Failed to generate requested number of images"
                 )
 
-        return GenerationResponse(
+        return generated_images, failed_engines
+
+    async def generate_images(self, request: GenerationRequest) -> GenerationResponse:
+        generated_images, failed_engines = await self._collect_images(request)
+        return GenerationResponse.model_construct(
             images=generated_images,
-            failed_engines=failed_engines
+            failed_engines=failed_engines,
+            timing=None
         )
+
+    async def generate_images_to_spool(self, request: GenerationRequest) -> ImageSpool:
+        """
+        Generates images like generate_images, but writes each engine batch to a temporary file as soon as it arrives.
+        The caller streams the response out with ImageSpool.iter_json, which also closes the spool.
+        """
+        spool = ImageSpool()
+        try:
+            _, spool.failed_engines = await self._collect_images(request, sink=spool)
+        except BaseException:
+            spool.close()
+            raise
+        return spool
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import tempfile
+from typing import List, Tuple, Iterable, Iterator, Optional, Dict, Any
+
+import orjson
+from fastapi import HTTPException
+
+from models.schemas import GenerationRequest, GeneratedImage, DistributionMode, ImageSize
+from services.scheduler import Overloaded
+
+# Image data a worker may hold in memory across all in-flight /generate requests
+MEMORY_BUDGET_BYTES = int(os.environ.get("IMAGE_MEMORY_BUDGET_MB", "2048")) * 1024 * 1024
+# Responses expected to be larger than this are spooled to a temporary file and streamed from there
+SPILL_THRESHOLD_BYTES = int(os.environ.get("IMAGE_SPILL_THRESHOLD_MB", "64")) * 1024 * 1024
+
+# Rough size of one base64 encoded PNG per requested size, the largest engine resolution for that size
+ESTIMATED_IMAGE_BYTES = {
+    ImageSize.SMALL: 600_000,
+    ImageSize.MEDIUM: 1_300_000,
+    ImageSize.LARGE: 2_200_000,
+}
+
+
+def estimate_response_bytes(request: GenerationRequest) -> int:
+    return max(0, request.num_engines_to_use * request.num_images * ESTIMATED_IMAGE_BYTES[request.image_size])
+
+
+def should_spool(request: GenerationRequest) -> bool:
+    return estimate_response_bytes(request) > SPILL_THRESHOLD_BYTES
+
+
+def in_flight_bytes(request: GenerationRequest) -> int:
+    """
+    Estimates the image data a /generate request holds in memory at its peak.
+    In memory responses hold every image twice, as strings and as the JSON body.
+    Spooled responses only hold the engine batches still running. In EVEN mode without fallback that is
+    one batch at a time, but a fallback engine is asked for every remaining image and WEIGHTED mode runs
+    all batches at once, so both can hold the whole response.
+    """
+    estimate = estimate_response_bytes(request)
+    if not should_spool(request):
+        return 2 * estimate
+    if request.distribution == DistributionMode.WEIGHTED or request.use_fallback:
+        return estimate
+    return max(0, request.num_images * ESTIMATED_IMAGE_BYTES[request.image_size])
+
+
+def stream_in_flight_bytes(request: GenerationRequest) -> int:
+    """
+    Estimates the image data a /generate/stream request can hold in memory.
+    Events wait in memory until the client reads them, so a slow client can hold every image of the request,
+    previews included.
+    """
+    per_image = ESTIMATED_IMAGE_BYTES[request.image_size]
+    if request.preview and request.image_size != ImageSize.SMALL:
+        per_image += ESTIMATED_IMAGE_BYTES[ImageSize.SMALL]
+    return max(0, request.num_engines_to_use * request.num_images * per_image)
+
+
+class Reservation:
+    """Part of a MemoryBudget held by one request. Releasing is idempotent, so every exit path may call it."""
+
+    def __init__(self, budget: "MemoryBudget", num_bytes: int):
+        self.budget = budget
+        self.num_bytes = num_bytes
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.budget.used_bytes -= self.num_bytes
+
+
+class MemoryBudget:
+    """Accounts for the image data held in memory by in-flight requests of one worker"""
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+
+    def acquire(self, num_bytes: int) -> Reservation:
+        """
+        Holds num_bytes of the budget until the returned reservation is released.
+        Raises HTTPException 413 if num_bytes could never fit, and Overloaded while they are not available.
+        """
+        if num_bytes > self.limit_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail="Requested images exceed the worker's memory budget, request fewer or smaller images"
+            )
+        if self.used_bytes + num_bytes > self.limit_bytes:
+            raise Overloaded("Not enough memory for the requested images, retry later or request fewer images")
+        self.used_bytes += num_bytes
+        return Reservation(self, num_bytes)
+
+
+class ImageSpool:
+    """
+    Collects the images of one response in an anonymous temporary file instead of memory.
+    The hub adds each engine batch with extend_async, and iter_json reads them back
+    as the GenerationResponse JSON body in chunks.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.entries: List[Tuple[str, int, int]] = []
+        self.failed_engines: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def extend_async(self, images: List[GeneratedImage]):
+        """Writes a batch of images from a worker thread, a batch can be tens of megabytes"""
+        await asyncio.to_thread(self.extend, images)
+
+    def extend(self, images: Iterable[GeneratedImage]):
+        self.file.seek(0, os.SEEK_END)
+        for image in images:
+            data = image.base64_image.encode("ascii")
+            self.entries.append((image.engine_name, self.file.tell(), len(data)))
+            self.file.write(data)
+
+    def iter_json(self, timing: Optional[Dict[str, Any]] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Yields the JSON body of the response, closing the spool once it has been read or abandoned"""
+        try:
+            yield b'{"images":['
+            for i, (engine_name, offset, length) in enumerate(self.entries):
+                separator = b"," if i else b""
+                yield separator + b'{"engine_name":' + orjson.dumps(engine_name) + b',"base64_image":"'
+                self.file.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    chunk = self.file.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+                yield b'"}'
+            yield b'],"failed_engines":' + orjson.dumps(self.failed_engines) + b',"timing":' + orjson.dumps(timing) + b"}"
+        finally:
+            self.close()
+
+    def close(self):
+        self.file.close()
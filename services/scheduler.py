@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from models.schemas import Priority
+
+# Share of an engine's capacity each class gets while both are waiting
+PRIORITY_WEIGHTS = {
+    Priority.INTERACTIVE: 8,
+    Priority.BULK: 1,
+}
+
+
+class Overloaded(HTTPException):
+    def __init__(self, detail: str = "Server is overloaded, retry later"):
+        super().__init__(status_code=503, detail=detail)
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, tenant: str, cost: int, seq: int):
+        self.priority = priority
+        self.tenant = tenant
+        self.cost = max(cost, 1)
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class _PriorityClass:
+    """
+    The waiting calls of one priority. Its tenants share the class's capacity equally,
+    by stride scheduling on the number of images each call asks for.
+    """
+
+    def __init__(self):
+        # Position of the class itself in the scheduler's stride schedule
+        self.pass_value = 0.0
+        self.flows: Dict[str, Deque[_Waiter]] = {}
+        self.passes: Dict[str, float] = {}
+        self.virtual_time = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(flow) for flow in self.flows.values())
+
+    def push(self, waiter: _Waiter):
+        if waiter.tenant not in self.flows:
+            self.flows[waiter.tenant] = deque()
+            self.passes[waiter.tenant] = max(self.passes.get(waiter.tenant, 0.0), self.virtual_time)
+        self.flows[waiter.tenant].append(waiter)
+
+    def pop(self) -> _Waiter:
+        tenant = min(self.flows, key=lambda t: self.passes[t])
+        flow = self.flows[tenant]
+        waiter = flow.popleft()
+        self.virtual_time = self.passes[tenant]
+        self.passes[tenant] += waiter.cost
+        if not flow:
+            self._close_flow(tenant)
+        return waiter
+
+    def remove(self, waiter: _Waiter):
+        flow = self.flows.get(waiter.tenant)
+        if flow is None or waiter not in flow:
+            return
+        flow.remove(waiter)
+        if not flow:
+            self._close_flow(waiter.tenant)
+
+    def reset(self):
+        self.pass_value = 0.0
+        self.passes.clear()
+        self.virtual_time = 0.0
+
+    def _close_flow(self, tenant: str):
+        del self.flows[tenant]
+        # Only remember tenants that are ahead of virtual time, idle ones rejoin at virtual time anyway
+        if self.passes[tenant] <= self.virtual_time:
+            del self.passes[tenant]
+
+
+class FairScheduler:
+    """
+    Admits work onto one engine with at most max_concurrency calls running at once.
+
+    Waiting work is scheduled in two levels. Priority classes share capacity by stride scheduling
+    in proportion to PRIORITY_WEIGHTS and the number of images each call asks for, then the tenants
+    of a class share that class's capacity equally. Adding tenants therefore never shrinks another
+    class's share. When more than max_queue calls are waiting, the newest lowest-priority call is shed first.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int = 64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.classes: Dict[Priority, _PriorityClass] = {priority: _PriorityClass() for priority in PRIORITY_WEIGHTS}
+        self.virtual_time = 0.0
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(priority_class.queued for priority_class in self.classes.values())
+
+    async def acquire(self, priority: Priority, tenant: Optional[str] = None, cost: int = 1):
+        """Waits for a slot. Raises Overloaded if the call is shed. Every successful acquire must be released."""
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            return
+
+        if self.queued >= self.max_queue:
+            self._shed_for(priority)
+
+        waiter = _Waiter(priority, tenant or "", cost, next(self._seq))
+        priority_class = self.classes[priority]
+        if not priority_class.flows:
+            priority_class.pass_value = max(priority_class.pass_value, self.virtual_time)
+        priority_class.push(waiter)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # The slot was granted just before the caller went away
+                self.release()
+            else:
+                priority_class.remove(waiter)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+        if not self.active and not self.queued:
+            # Nothing is owed to anyone once the engine goes idle
+            for priority_class in self.classes.values():
+                priority_class.reset()
+            self.virtual_time = 0.0
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            waiting = [priority for priority, priority_class in self.classes.items() if priority_class.flows]
+            if not waiting:
+                return
+            priority = min(waiting, key=lambda p: self.classes[p].pass_value)
+            priority_class = self.classes[priority]
+            waiter = priority_class.pop()
+            if waiter.future.done():
+                continue
+
+            self.virtual_time = priority_class.pass_value
+            priority_class.pass_value += waiter.cost / PRIORITY_WEIGHTS[priority]
+            self.active += 1
+            waiter.future.set_result(None)
+
+    def _shed_for(self, priority: Priority):
+        """Makes room for a new call of the given priority, or rejects it if nothing queued ranks lower"""
+        waiters = [
+            waiter
+            for priority_class in self.classes.values()
+            for flow in priority_class.flows.values()
+            for waiter in flow
+        ]
+        victim = min(waiters, key=lambda w: (PRIORITY_WEIGHTS[w.priority], -w.seq))
+        if PRIORITY_WEIGHTS[victim.priority] >= PRIORITY_WEIGHTS[priority]:
+            raise Overloaded()
+
+        self.classes[victim.priority].remove(victim)
+        victim.future.set_exception(Overloaded("Request was shed in favour of higher priority traffic"))
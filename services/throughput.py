@@ -0,0 +1,96 @@
+import math
+import time
+from typing import List, Optional
+
+# After this long without a sample, an engine's measured rate counts only half against the default rate
+STALE_HALF_LIFE_SECONDS = 60.0
+
+
+class EngineThroughput:
+    """
+    Tracks the observed generation speed and the outstanding work of a single engine.
+    Speed is kept as an exponentially weighted moving average of seconds per image.
+    """
+
+    def __init__(self, smoothing: float = 0.3, half_life: float = STALE_HALF_LIFE_SECONDS):
+        self.smoothing = smoothing
+        self.half_life = half_life
+        self.seconds_per_image: Optional[float] = None
+        self.last_sample_at: Optional[float] = None
+        self.in_flight = 0
+
+    def start(self, num_images: int):
+        self.in_flight += num_images
+
+    def finish(self, num_images: int, elapsed: float, success: bool):
+        self.in_flight = max(0, self.in_flight - num_images)
+        if not success or num_images <= 0 or elapsed <= 0:
+            return
+
+        sample = elapsed / num_images
+        self.last_sample_at = time.monotonic()
+        if self.seconds_per_image is None:
+            self.seconds_per_image = sample
+        else:
+            self.seconds_per_image += self.smoothing * (sample - self.seconds_per_image)
+
+    @property
+    def images_per_second(self) -> Optional[float]:
+        if not self.seconds_per_image:
+            return None
+        return 1.0 / self.seconds_per_image
+
+    def estimated_rate(self, default_rate: float, now: Optional[float] = None) -> float:
+        """
+        Returns the measured images per second, drifting towards default_rate as the last sample ages.
+        An engine that stopped getting work after one slow sample would otherwise never be measured again.
+        """
+        if self.images_per_second is None:
+            return default_rate
+        now = time.monotonic() if now is None else now
+        freshness = 0.5 ** (max(0.0, now - self.last_sample_at) / self.half_life)
+        return freshness * self.images_per_second + (1 - freshness) * default_rate
+
+
+def allocate_images(total_images: int, rates: List[float], queue_depths: List[float]) -> List[int]:
+    """
+    Splits total_images across engines so that they all finish at about the same time.
+
+    Each engine i is modelled as working through queue_depths[i] images already in flight
+    at rates[i] images per second. Images are water-filled onto the engines that would
+    otherwise finish first, then rounded with the largest remainder method so the
+    allocation always sums to total_images. Engines with a rate of 0 get nothing,
+    unless no engine has a positive rate, in which case all are treated alike.
+    """
+    if total_images <= 0 or not rates:
+        return [0] * len(rates)
+    if not any(rate > 0 for rate in rates):
+        rates = [1.0] * len(rates)
+
+    # Engines that can take work, ordered by when they would drain their current queue
+    order = sorted(
+        (i for i in range(len(rates)) if rates[i] > 0),
+        key=lambda i: queue_depths[i] / rates[i]
+    )
+
+    # Grow the set of active engines until the common finish time covers the next one
+    active_rate = 0.0
+    active_queue = 0.0
+    finish_time = 0.0
+    for position, i in enumerate(order):
+        active_rate += rates[i]
+        active_queue += queue_depths[i]
+        finish_time = (total_images + active_queue) / active_rate
+        next_engine = order[position + 1] if position + 1 < len(order) else None
+        if next_engine is None or finish_time <= queue_depths[next_engine] / rates[next_engine]:
+            break
+
+    shares = [max(0.0, rates[i] * finish_time - queue_depths[i]) if rates[i] > 0 else 0.0 for i in range(len(rates))]
+    allocation = [math.floor(share) for share in shares]
+
+    leftover = max(0, total_images - sum(allocation))
+    by_remainder = sorted(range(len(rates)), key=lambda i: shares[i] - allocation[i], reverse=True)
+    for i in by_remainder[:leftover]:
+        allocation[i] += 1
+
+    return allocation
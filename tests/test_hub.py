@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from models.schemas import EngineConfig, GenerationRequest, StreamEventType
+from services.hub import ImageGeneratorHub
+from tests.test_throughput import StubGenerator
+
+
+class SeededGenerator(StubGenerator):
+    supports_preview = True
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.seeds = []
+
+    async def generate(self, params, prompt, size, num_images):
+        self.seeds.append(params.get("seed"))
+        return await super().generate(params, prompt, size, num_images)
+
+
+def _request(engines, **fields) -> GenerationRequest:
+    return GenerationRequest(
+        engines=[EngineConfig(name=name, params=params, prompt="a cat") for name, params in engines],
+        num_engines_to_use=len(engines),
+        **fields
+    )
+
+
+def test_reused_engine_gets_a_new_seed_per_batch():
+    hub = ImageGeneratorHub()
+    engine = SeededGenerator("sd")
+    hub.register_engine(engine)
+
+    request = _request([("sd", {}), ("sd", {})], num_images=2, seed=10)
+    response = asyncio.run(hub.generate_images(request))
+
+    assert len(response.images) == 4
+    assert engine.seeds == [10, 12]
+
+
+def test_stream_reports_the_seed_of_each_image():
+    hub = ImageGeneratorHub()
+    hub.register_engine(SeededGenerator("sd"))
+
+    async def collect():
+        request = _request([("sd", {}), ("sd", {})], num_images=2, seed=10, preview=True)
+        return [event async for event in hub.stream_images(request)]
+
+    events = asyncio.run(collect())
+    seeds = sorted(event.seed for event in events if event.type == StreamEventType.IMAGE)
+    preview_seeds = sorted(event.seed for event in events if event.type == StreamEventType.PREVIEW)
+    assert seeds == [10, 11, 12, 13]
+    assert preview_seeds == seeds
+
+
+def test_engine_seeds_are_normalised_to_int():
+    hub = ImageGeneratorHub()
+    configs = hub._engine_configs(_request([("a", {"seed": "5"}), ("b", {"seed": None}), ("c", {})], seed=7), 7)
+    assert [config["params"]["seed"] for config in configs] == [5, 7, 7]
+
+    with pytest.raises(HTTPException) as e:
+        hub.stream_images(_request([("a", {"seed": "five"})]))
+    assert e.value.status_code == 400
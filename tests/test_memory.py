@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from models.schemas import EngineConfig, GeneratedImage, GenerationRequest, GenerationResponse
+from services.memory import ImageSpool, MemoryBudget, estimate_response_bytes
+from services.scheduler import Overloaded
+
+
+def test_reservation_release_is_idempotent():
+    budget = MemoryBudget(limit_bytes=100)
+    reservation = budget.acquire(60)
+    assert budget.used_bytes == 60
+
+    reservation.release()
+    reservation.release()
+    assert budget.used_bytes == 0
+
+
+def test_full_budget_is_overloaded():
+    budget = MemoryBudget(limit_bytes=100)
+    budget.acquire(60)
+    with pytest.raises(Overloaded):
+        budget.acquire(50)
+    assert budget.used_bytes == 60
+
+
+def test_request_larger_than_budget_is_too_large():
+    budget = MemoryBudget(limit_bytes=100)
+    with pytest.raises(HTTPException) as e:
+        budget.acquire(101)
+    assert e.value.status_code == 413
+    assert budget.used_bytes == 0
+
+
+def test_image_counts_must_be_positive():
+    engines = [EngineConfig(name="a", params={}, prompt="a cat")]
+    with pytest.raises(ValidationError):
+        GenerationRequest(engines=engines, num_engines_to_use=1, num_images=-5)
+    with pytest.raises(ValidationError):
+        GenerationRequest(engines=engines, num_engines_to_use=0)
+
+    # Unvalidated requests never reserve a negative amount
+    request = GenerationRequest.model_construct(engines=engines, num_engines_to_use=1, num_images=-5)
+    assert estimate_response_bytes(request) == 0
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1024 * 1024])
+def test_spool_round_trips_to_the_same_response(chunk_size):
+    images = [
+        GeneratedImage(engine_name="dall-e", base64_image="aGVsbG8gd29ybGQ="),
+        GeneratedImage(engine_name='quote"engine', base64_image=""),
+        GeneratedImage(engine_name="sd", base64_image="QUJD" * 1000),
+    ]
+    timing = {"name": "generate", "duration_ms": 1.5, "attributes": {}, "children": []}
+    spool = ImageSpool()
+    spool.failed_engines = ["replicate"]
+    asyncio.run(spool.extend_async(images[:2]))
+    spool.extend(images[2:])
+
+    body = b"".join(spool.iter_json(timing, chunk_size=chunk_size))
+    expected = GenerationResponse(images=images, failed_engines=["replicate"], timing=timing)
+    assert GenerationResponse.model_validate(json.loads(body)) == expected
+    assert spool.file.closed
+
+
+def test_empty_spool_is_valid_json():
+    body = b"".join(ImageSpool().iter_json())
+    assert json.loads(body) == {"images": [], "failed_engines": [], "timing": None}
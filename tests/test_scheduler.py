@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from models.schemas import Priority
+from services.scheduler import FairScheduler, Overloaded
+
+
+async def _grant_order(scheduler, calls):
+    """Queues calls behind a held slot, then frees one slot at a time and returns the order they were admitted in"""
+    order = []
+    await scheduler.acquire(Priority.INTERACTIVE, "holder")
+
+    async def call(priority, tenant):
+        await scheduler.acquire(priority, tenant)
+        order.append((priority, tenant))
+
+    tasks = [asyncio.create_task(call(priority, tenant)) for priority, tenant in calls]
+    await asyncio.sleep(0)
+    while len(order) < len(calls):
+        admitted = len(order)
+        scheduler.release()
+        while len(order) == admitted:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.parametrize("num_bulk_tenants", [1, 40])
+def test_class_share_does_not_depend_on_tenant_count(num_bulk_tenants):
+    bulk = [(Priority.BULK, f"tenant-{i % num_bulk_tenants}") for i in range(40)]
+    interactive = [(Priority.INTERACTIVE, "user")] * 40
+    order = asyncio.run(_grant_order(FairScheduler(max_concurrency=1, max_queue=1000), bulk + interactive))
+
+    # While both classes are backlogged, INTERACTIVE gets 8 of every 9 slots
+    first = order[:45]
+    assert sum(priority == Priority.INTERACTIVE for priority, _ in first) == 40
+
+
+def test_stride_ordering_between_classes():
+    calls = [(Priority.BULK, "a")] * 3 + [(Priority.INTERACTIVE, "b")] * 17
+    order = asyncio.run(_grant_order(FairScheduler(max_concurrency=1), calls))
+
+    priorities = [priority for priority, _ in order]
+    # Both classes start level, after that BULK waits for 8 INTERACTIVE grants each time
+    assert priorities[:20] == [Priority.INTERACTIVE, Priority.BULK] + ([Priority.INTERACTIVE] * 8 + [Priority.BULK]) * 2
+
+
+def test_tenants_share_their_class_equally():
+    calls = [(Priority.BULK, "big")] * 6 + [(Priority.BULK, "small")] * 2
+    order = asyncio.run(_grant_order(FairScheduler(max_concurrency=1), calls))
+
+    assert [tenant for _, tenant in order] == ["big", "small", "big", "small", "big", "big", "big", "big"]
+
+
+def test_sheds_newest_lowest_priority_waiter():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=2)
+        await scheduler.acquire(Priority.INTERACTIVE)
+        older = asyncio.create_task(scheduler.acquire(Priority.BULK, "a"))
+        newer = asyncio.create_task(scheduler.acquire(Priority.BULK, "b"))
+        await asyncio.sleep(0)
+
+        urgent = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE, "c"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await newer
+        assert not older.done()
+
+        # Nothing queued ranks below a new BULK call, so it is rejected itself
+        with pytest.raises(Overloaded):
+            await scheduler.acquire(Priority.BULK, "d")
+
+        scheduler.release()
+        await urgent
+        scheduler.release()
+        await older
+        scheduler.release()
+        assert scheduler.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_grant_releases_the_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire(Priority.INTERACTIVE)
+        waiting = asyncio.create_task(scheduler.acquire(Priority.BULK))
+        await asyncio.sleep(0)
+
+        # The slot is handed over, but the caller is cancelled before it resumes
+        scheduler.release()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.active == 0
+        assert scheduler.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_waiting_leaves_the_queue():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire(Priority.INTERACTIVE)
+        waiting = asyncio.create_task(scheduler.acquire(Priority.BULK, "a"))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.queued == 0
+        assert scheduler.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_passes_reset_when_idle():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await _grant_order(scheduler, [(Priority.BULK, "a")] * 3 + [(Priority.INTERACTIVE, "b")] * 3)
+        for _ in range(scheduler.active):
+            scheduler.release()
+
+        assert scheduler.active == 0
+        assert scheduler.virtual_time == 0.0
+        for priority_class in scheduler.classes.values():
+            assert priority_class.pass_value == 0.0
+            assert priority_class.virtual_time == 0.0
+            assert not priority_class.passes
+
+    asyncio.run(scenario())
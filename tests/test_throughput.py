@@ -0,0 +1,118 @@
+from enum import Enum
+
+import pytest
+
+from core.image_generator import ImageGenerator
+from models.schemas import ImageSize
+from services.hub import ImageGeneratorHub
+from services.throughput import EngineThroughput, allocate_images
+
+
+class StubGenerator(ImageGenerator):
+    class Size(Enum):
+        SMALL = (512, 512)
+        MEDIUM = (768, 768)
+        LARGE = (1024, 1024)
+
+    def __init__(self, name: str):
+        super().__init__(name=name, description="stub")
+
+    async def generate(self, params, prompt, size, num_images):
+        return ["image"] * num_images
+
+    def get_required_params(self):
+        return []
+
+
+@pytest.mark.parametrize("total_images, rates, queue_depths", [
+    (10, [1.0, 4.0], [0, 0]),
+    (7, [1.0, 2.0, 3.0], [0, 0, 0]),
+    (13, [0.3, 0.7, 1.1], [2, 0, 5]),
+    (1, [1.0, 1.0, 1.0], [0, 0, 0]),
+    (100, [0.01, 50.0], [0.5, 3.2]),
+])
+def test_allocation_sums_to_total(total_images, rates, queue_depths):
+    allocation = allocate_images(total_images, rates, queue_depths)
+    assert sum(allocation) == total_images
+    assert all(count >= 0 for count in allocation)
+
+
+def test_allocation_is_proportional_to_rate_for_idle_engines():
+    assert allocate_images(10, [1.0, 4.0], [0, 0]) == [2, 8]
+    assert allocate_images(6, [1.0, 1.0, 1.0], [0, 0, 0]) == [2, 2, 2]
+
+
+def test_busy_engine_gets_less_than_idle_engine():
+    assert allocate_images(10, [1.0, 1.0], [0, 8]) == [9, 1]
+    # Queue longer than the whole request: the busy engine gets nothing
+    assert allocate_images(3, [1.0, 1.0], [0, 10]) == [3, 0]
+
+
+def test_single_engine_gets_everything():
+    assert allocate_images(5, [0.2], [40]) == [5]
+
+
+def test_nothing_to_allocate():
+    assert allocate_images(0, [1.0, 2.0], [0, 0]) == [0, 0]
+    assert allocate_images(5, [], []) == []
+
+
+def test_zero_rates():
+    assert allocate_images(4, [0.0, 2.0], [0, 0]) == [0, 4]
+    assert allocate_images(4, [0.0, 0.0], [0, 0]) == [2, 2]
+
+
+def test_throughput_is_a_moving_average_of_successful_calls():
+    stats = EngineThroughput(smoothing=0.5)
+    stats.start(4)
+    assert stats.in_flight == 4
+    stats.finish(4, elapsed=4.0, success=True)
+    assert stats.seconds_per_image == 1.0
+    stats.start(2)
+    stats.finish(2, elapsed=6.0, success=True)
+    assert stats.seconds_per_image == 2.0
+    stats.start(2)
+    stats.finish(2, elapsed=100.0, success=False)
+    assert stats.seconds_per_image == 2.0
+    assert stats.in_flight == 0
+
+
+def test_stale_rate_drifts_towards_default():
+    stats = EngineThroughput(half_life=10.0)
+    stats.finish(1, elapsed=10.0, success=True)
+    sampled_at = stats.last_sample_at
+
+    assert stats.estimated_rate(default_rate=1.0, now=sampled_at) == pytest.approx(0.1)
+    assert stats.estimated_rate(default_rate=1.0, now=sampled_at + 10.0) == pytest.approx(0.55)
+    assert stats.estimated_rate(default_rate=1.0, now=sampled_at + 1000.0) == pytest.approx(1.0)
+    assert EngineThroughput().estimated_rate(default_rate=3.0) == 3.0
+
+
+def test_hub_allocation_uses_rates_of_the_requested_size():
+    hub = ImageGeneratorHub()
+    fast, slow = StubGenerator("fast"), StubGenerator("slow")
+    hub.register_engine(fast)
+    hub.register_engine(slow)
+
+    # At SMALL both are equally fast, at LARGE fast is three times faster
+    hub.throughput[("fast", ImageSize.SMALL)].finish(1, elapsed=1.0, success=True)
+    hub.throughput[("slow", ImageSize.SMALL)].finish(1, elapsed=1.0, success=True)
+    hub.throughput[("fast", ImageSize.LARGE)].finish(1, elapsed=1.0, success=True)
+    hub.throughput[("slow", ImageSize.LARGE)].finish(1, elapsed=3.0, success=True)
+
+    assert hub._allocate_by_throughput([fast, slow], "SMALL", 8) == [4, 4]
+    assert hub._allocate_by_throughput([fast, slow], "LARGE", 8) == [6, 2]
+
+
+def test_hub_counts_queued_work_of_other_sizes_as_time():
+    hub = ImageGeneratorHub()
+    a, b = StubGenerator("a"), StubGenerator("b")
+    hub.register_engine(a)
+    hub.register_engine(b)
+    for name in ("a", "b"):
+        hub.throughput[(name, ImageSize.SMALL)].finish(1, elapsed=1.0, success=True)
+        hub.throughput[(name, ImageSize.LARGE)].finish(1, elapsed=4.0, success=True)
+
+    # Eight SMALL images queued on a take as long as two LARGE ones
+    hub.throughput[("a", ImageSize.SMALL)].start(8)
+    assert hub._allocate_by_throughput([a, b], "LARGE", 4) == [1, 3]
@@ -1,7 +1,10 @@
 import base64
+from urllib.parse import urlparse
 
 import requests
 
+from core.tracing import span
+
 
 def img_to_base64(img: bytes) -> str:
     """
@@ -13,7 +16,8 @@ def img_to_base64(img: bytes) -> str:
     Returns:
         str: Base64-encoded image string.
     """
-    return base64.b64encode(img).decode('utf-8')
+    with span("base64", bytes=len(img)):
+        return base64.b64encode(img).decode('utf-8')
 
 
 def url_to_base64(url: str) -> str:
@@ -26,6 +30,8 @@ def url_to_base64(url: str) -> str:
     Returns:
         str: Base64-encoded image string.
     """
-    response = requests.get(url)
-    response.raise_for_status()
+    # Only the host is recorded, delivery URLs grant access to the image and end up in responses and trace files
+    with span("download", host=urlparse(url).hostname or ""):
+        response = requests.get(url)
+        response.raise_for_status()
     return img_to_base64(response.content)